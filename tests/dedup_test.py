@@ -0,0 +1,175 @@
+import datetime
+
+import pytest
+
+from tweetlastic.utils.dedup import NearDuplicateDetector, normalize_text
+from tweetlastic.utils.sinks import DedupSink
+
+START = datetime.datetime(2020, 3, 1, 10, tzinfo=datetime.timezone.utc)
+SPAM = 'Win a free ticket to NeurIPS 2020!! Click here https://t.co/{} @user{}'
+
+class ListSink():
+  def __init__(self):
+    self.saved = []
+    self.counts = {}
+  def save(self, tweet):
+    self.saved.append(tweet)
+  def increment(self, id_str, field, count):
+    self.counts[id_str] = self.counts.get(id_str, 0) + count
+  def tick(self):
+    return
+  def close(self):
+    return
+
+def make_tweet(id_str, text, minutes=0):
+  return {'id_str': id_str, 'text': text, 'date': START + datetime.timedelta(minutes=minutes)}
+
+def test_normalize_text():
+  """
+  Test that urls, mentions and punctuation are removed from the text
+  """
+  assert normalize_text(SPAM.format('abc', 1)) == 'win a free ticket to neurips 2020 click here'
+
+def test_detector_window():
+  """
+  Test that near-duplicates are detected inside the time window and forgotten after it
+  """
+  detector = NearDuplicateDetector(window_minutes=60)
+
+  assert detector.check('1', SPAM.format('a', 1), START) is None
+  assert detector.check('2', SPAM.format('b', 2) + ' now', START) == '1'
+  assert detector.check('3', 'Great keynote today about reinforcement learning at ICML', START) is None
+  assert detector.check('4', SPAM.format('c', 3), START + datetime.timedelta(minutes=90)) is None
+  assert len(detector.signatures) == 1, "Old signatures were not forgotten"
+
+def test_detector_redelivery():
+  """
+  Test that a redelivered tweet is not flagged as a near-duplicate of itself
+  """
+  detector = NearDuplicateDetector()
+
+  assert detector.check('1', SPAM.format('a', 1), START) is None
+  assert detector.check('1', SPAM.format('a', 1), START) is None
+  assert detector.check('2', SPAM.format('b', 2), START) == '1'
+
+def test_detector_shared_buckets():
+  """
+  Test that representatives sharing LSH bands are all registered there, and stay there after the first of them expires
+  """
+  detector = NearDuplicateDetector(window_minutes=60, threshold=0.95)
+  first = 'Great keynote today about reinforcement learning at ICML in Vienna'
+  second = first + ' with amazing speakers'
+
+  assert detector.check('1', first, START) is None
+  assert detector.check('2', second, START + datetime.timedelta(minutes=30)) is None
+  keys = detector.band_keys(detector.signatures['2'])
+  assert any('1' in detector.buckets[key] for key in keys), "Texts do not share any band"
+  assert all('2' in detector.buckets[key] for key in keys)
+
+  detector.expire(START + datetime.timedelta(minutes=70))
+  assert '1' not in detector.signatures
+  assert all(detector.buckets[key] == {'2'} for key in keys)
+
+@pytest.mark.parametrize('mode', ['drop', 'tag', 'collapse'])
+def test_dedup_sink_modes(mode):
+  """
+  Test the drop, tag and collapse modes
+  """
+  tweets = [make_tweet(str(i), SPAM.format(i, i), minutes=i) for i in range(4)]
+
+  target = ListSink()
+  sink = DedupSink(target, NearDuplicateDetector(), mode=mode)
+  for tweet in tweets:
+    sink.save(tweet)
+  sink.close()
+
+  assert sink.suppression_rate() == 0.75
+  if mode == 'tag':
+    assert [tweet.get('near_duplicate_of') for tweet in target.saved] == [None, '0', '0', '0']
+  else:
+    assert [tweet['id_str'] for tweet in target.saved] == ['0']
+  if mode == 'collapse':
+    assert target.counts == {'0': 3}
+
+def test_dedup_sink_flush_failure():
+  """
+  Test that counts already applied are not sent again after a failed flush
+  """
+  class FlakySink(ListSink):
+    failed = False
+    def increment(self, id_str, field, count):
+      if id_str == 'b' and not self.failed:
+        self.failed = True
+        raise ConnectionError
+      super().increment(id_str, field, count)
+
+  target = FlakySink()
+  sink = DedupSink(target, NearDuplicateDetector(), mode='collapse')
+  sink.pending_counts = {'a': 2, 'b': 3}
+  with pytest.raises(ConnectionError):
+    sink.flush()
+  sink.flush()
+
+  assert target.counts == {'a': 2, 'b': 3}
+
+def test_dedup_sink_flushes_stale_counts():
+  """
+  Test that collapsed counts are sent once the oldest of them has waited flush_seconds
+  """
+  target = ListSink()
+  sink = DedupSink(target, NearDuplicateDetector(), mode='collapse', flush_seconds=60)
+  sink.save(make_tweet('0', SPAM.format(0, 0)))
+  sink.save(make_tweet('1', SPAM.format(1, 1)))
+  sink.tick()
+  assert target.counts == {}
+
+  sink.pending_started -= 60
+  sink.tick()
+  assert target.counts == {'0': 1}
+
+def test_dedup_sink_skips_redeliveries():
+  """
+  Test that redelivered tweets (representative or duplicate) are neither saved again nor counted again
+  """
+  class IndexSink(ListSink):
+    # Saving a document replaces it, as es.index does with the same id
+    def save(self, tweet):
+      super().save(tweet)
+      self.counts.pop(tweet['id_str'], None)
+
+  target = IndexSink()
+  sink = DedupSink(target, NearDuplicateDetector(), mode='collapse')
+  sink.save(make_tweet('0', SPAM.format(0, 0)))
+  sink.save(make_tweet('1', SPAM.format(1, 1)))
+  sink.flush()
+
+  sink.save(make_tweet('0', SPAM.format(0, 0)))
+  sink.save(make_tweet('1', SPAM.format(1, 1)))
+  sink.close()
+
+  assert [tweet['id_str'] for tweet in target.saved] == ['0']
+  assert target.counts == {'0': 1}
+  assert sink.duplicates == 1
+
+def test_dedup_sink_forgets_unsaved_tweets():
+  """
+  Test that a tweet that could not be saved is not kept as representative, so that its copies are not dropped
+  """
+  class DownSink(ListSink):
+    down = True
+    def save(self, tweet):
+      if self.down:
+        raise ConnectionError
+      super().save(tweet)
+
+  target = DownSink()
+  sink = DedupSink(target, NearDuplicateDetector(), mode='drop')
+  with pytest.raises(ConnectionError):
+    sink.save(make_tweet('0', SPAM.format(0, 0)))
+
+  target.down = False
+  sink.save(make_tweet('1', SPAM.format(1, 1)))
+  sink.save(make_tweet('2', SPAM.format(2, 2)))
+
+  assert [tweet['id_str'] for tweet in target.saved] == ['1']
+  assert list(sink.detector.signatures) == ['1']
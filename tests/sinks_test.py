@@ -0,0 +1,120 @@
+import datetime
+
+import elasticsearch
+import pytest
+
+from tweetlastic.utils.sinks import ArchiveSink, ElasticSink, FanOutSink, list_segments, read_archive
+
+def make_tweet(id_str, date):
+  return {'id_str': id_str, 'date': date, 'text': 'Hola', 'user': {'created_at': date}}
+
+def test_archive_roundtrip(tmp_path):
+  """
+  Test that archived tweets are split into hourly segments and can be replayed in order
+  """
+  start = datetime.datetime(2020, 3, 1, 10, 59, tzinfo=datetime.timezone.utc)
+  tweets = [make_tweet(str(i), start + datetime.timedelta(seconds=30 * i)) for i in range(5)]
+
+  sink = ArchiveSink(str(tmp_path), row_group_size=2)
+  for tweet in tweets:
+    sink.save(tweet)
+  sink.close()
+
+  assert len(list_segments(str(tmp_path))) == 2, "Tweets not split into hourly segments"
+
+  replayed = list(read_archive(str(tmp_path)))
+  assert [tweet['id_str'] for tweet in replayed] == [tweet['id_str'] for tweet in tweets]
+  assert replayed[0]['date'] == tweets[0]['date'].isoformat()
+
+  replayed = list(read_archive(str(tmp_path), start=start + datetime.timedelta(minutes=1)))
+  assert [tweet['id_str'] for tweet in replayed] == ['2', '3', '4']
+
+def test_fan_out_isolates_errors(tmp_path):
+  """
+  Test that a failing sink does not prevent the rest from saving the tweet, and that its error is still raised
+  """
+  class FailingSink():
+    def save(self, tweet):
+      raise ValueError
+    def close(self):
+      return
+
+  archive = ArchiveSink(str(tmp_path))
+  sink = FanOutSink([FailingSink(), archive])
+  with pytest.raises(ValueError):
+    sink.save(make_tweet('1', datetime.datetime(2020, 3, 1, 10, tzinfo=datetime.timezone.utc)))
+  sink.close()
+
+  assert [tweet['id_str'] for tweet in read_archive(str(tmp_path))] == ['1']
+
+def test_fan_out_propagates_elastic_errors(tmp_path):
+  """
+  Test that an ElasticSearch outage is raised to start_stream, while the archive still gets the tweet
+  """
+  class DownElastic():
+    def index(self, **kwargs):
+      raise elasticsearch.ConnectionError('N/A', 'Connection refused', None)
+
+  archive = ArchiveSink(str(tmp_path))
+  sink = FanOutSink([ElasticSink(DownElastic(), 'tweets'), archive])
+  with pytest.raises(elasticsearch.ConnectionError):
+    sink.save(make_tweet('1', datetime.datetime(2020, 3, 1, 10, tzinfo=datetime.timezone.utc)))
+  archive.close()
+
+  assert [tweet['id_str'] for tweet in read_archive(str(tmp_path))] == ['1']
+
+def test_archive_flushes_stale_rows(tmp_path):
+  """
+  Test that buffered rows are written once the oldest of them has waited flush_seconds, even without new tweets
+  """
+  sink = ArchiveSink(str(tmp_path), flush_seconds=60)
+  sink.save(make_tweet('1', datetime.datetime(2020, 3, 1, 10, tzinfo=datetime.timezone.utc)))
+  sink.tick()
+  assert list(read_archive(str(tmp_path))) == []
+
+  sink.buffer_started -= 60
+  sink.tick()
+  assert [tweet['id_str'] for tweet in read_archive(str(tmp_path))] == ['1']
+
+def test_archive_filter_timezones(tmp_path):
+  """
+  Test that start and end in other timezones are converted to UTC when selecting segments
+  """
+  date = datetime.datetime(2020, 3, 1, 10, tzinfo=datetime.timezone.utc)
+  sink = ArchiveSink(str(tmp_path))
+  sink.save(make_tweet('1', date))
+  sink.close()
+
+  madrid = datetime.timezone(datetime.timedelta(hours=1))
+  assert [tweet['id_str'] for tweet in read_archive(str(tmp_path), start=date.astimezone(madrid))] == ['1']
+  assert [tweet['id_str'] for tweet in read_archive(str(tmp_path), end=date.astimezone(madrid))] == ['1']
+  assert list(read_archive(str(tmp_path), start=date.astimezone(madrid) + datetime.timedelta(hours=1))) == []
+
+def test_archive_segments_in_utc(tmp_path):
+  """
+  Test that tweets with non-UTC dates are archived in the segment of their UTC hour
+  """
+  date = datetime.datetime(2020, 3, 1, 12, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))
+  sink = ArchiveSink(str(tmp_path))
+  sink.save(make_tweet('1', date))
+  sink.close()
+
+  hour = datetime.datetime(2020, 3, 1, 10, tzinfo=datetime.timezone.utc)
+  assert [tweet['id_str'] for tweet in read_archive(str(tmp_path), start=hour, end=hour)] == ['1']
+  assert list_segments(str(tmp_path))[0].endswith('20200301_10.jsonl.zst')
+
+def test_archive_retries_failed_flush(tmp_path):
+  """
+  Test that rows are kept in memory when a flush fails, and written by the next one
+  """
+  sink = ArchiveSink(str(tmp_path / 'archive'))
+  sink.save(make_tweet('1', datetime.datetime(2020, 3, 1, 10, tzinfo=datetime.timezone.utc)))
+
+  (tmp_path / 'archive').rmdir()
+  with pytest.raises(FileNotFoundError):
+    sink.flush()
+  assert len(sink.buffer) == 1
+
+  (tmp_path / 'archive').mkdir()
+  sink.close()
+  assert [tweet['id_str'] for tweet in read_archive(str(tmp_path / 'archive'))] == ['1']
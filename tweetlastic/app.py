@@ -1,9 +1,13 @@
 import elasticsearch
 import logging
+import signal
+import sys
 import tweepy
 import yaml
 
 from tweetlastic.utils.elastic import IndexOperations, set_elastic_path
+from tweetlastic.utils.sinks import ElasticSink, ArchiveSink, DedupSink, FanOutSink
+from tweetlastic.utils.dedup import NearDuplicateDetector
 from tweetlastic.utils.twitter import CustomStream, start_stream, set_twitter_auth
 from tweetlastic.utils.aux import set_logging_level
 
@@ -30,15 +34,40 @@ es = elasticsearch.Elasticsearch(elastic_path)
 # Create ElasticSearch index if it doesn't exist (or force overwrite)
 IndexOperations().create_index(es, index_name = settings["elastic_index_name"], overwrite = settings["overwrite_index"])
 
+### Define where the parsed tweets are saved
+elastic_sink = ElasticSink(es, settings["elastic_index_name"])
+# Optionally suppress near-duplicate tweets (spam bursts) before indexing them
+if settings["near_duplicates"]["enabled"]:
+  detector = NearDuplicateDetector(threshold=float(settings["near_duplicates"]["threshold"]),
+                                   window_minutes=int(settings["near_duplicates"]["window_minutes"]),
+                                   max_signatures=int(settings["near_duplicates"]["max_signatures"]))
+  elastic_sink = DedupSink(elastic_sink, detector,
+                           mode=settings["near_duplicates"]["mode"],
+                           flush_seconds=int(settings["near_duplicates"]["flush_seconds"]))
+sinks = [elastic_sink]
+# Optionally keep a compressed copy of every tweet on disk
+if settings["archive"]["enabled"]:
+  sinks.append(ArchiveSink(settings["archive"]["path"],
+                           row_group_size=int(settings["archive"]["row_group_size"]),
+                           compression_level=int(settings["archive"]["compression_level"]),
+                           flush_seconds=int(settings["archive"]["flush_seconds"])))
+sink = FanOutSink(sinks)
+
 ### Initiate the stream
 auth = set_twitter_auth()
-myStreamListener = CustomStream(es, settings["elastic_index_name"], settings["logging_level"], api=None)
+myStreamListener = CustomStream(sink, settings["logging_level"], api=None)
 myStream = tweepy.Stream(auth = auth, listener = myStreamListener)
 
 ### Execute the stream
-start_stream(myStream,
-            max_reconnects=int(settings["reconnect_stream"]["max_reconnects"]),
-            hours_to_reset_counter=int(settings["reconnect_stream"]["hours_to_reset_counter"]),
-            track=terms_to_follow,
-            is_async=False,
-            stall_warnings=True)
+# docker stop sends SIGTERM, exit through the finally clause so that buffered tweets are flushed
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+try:
+  start_stream(myStream,
+              max_reconnects=int(settings["reconnect_stream"]["max_reconnects"]),
+              hours_to_reset_counter=int(settings["reconnect_stream"]["hours_to_reset_counter"]),
+              track=terms_to_follow,
+              is_async=False,
+              stall_warnings=True)
+finally:
+  # Flush the tweets still buffered in memory
+  sink.close()
\ No newline at end of file
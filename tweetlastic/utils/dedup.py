@@ -0,0 +1,145 @@
+# Standard
+import re
+import zlib
+import datetime
+import collections
+# Extra
+import numpy as np
+
+
+# Mersenne prime used for the MinHash permutations. Shingle hashes are reduced below it so that a*x + b fits in 64 bits.
+_PRIME = (1 << 31) - 1
+
+def normalize_text(text):
+    '''
+    Lowercase the text and remove urls, mentions, punctuation and repeated spaces, which are what usually changes between copies of spam
+    '''
+
+    text = text.lower()
+    text = re.sub(r'https?://\S+', ' ', text)
+    text = re.sub(r'@\w+', ' ', text)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+class NearDuplicateDetector():
+
+    '''
+    Streaming near-duplicate detector based on MinHash signatures and LSH banding.
+
+    Only the first tweet of every group of near-duplicates (the representative) is remembered. Representatives are
+    forgotten once they are older than window_minutes or when more than max_signatures of them are kept, and the ids
+    of every checked tweet (used to recognise redeliveries) once they are older than window_minutes or more than
+    max_seen_ids of them are kept, so memory stays bounded no matter the volume of the stream.
+    '''
+
+    def __init__(self, threshold=0.8, window_minutes=60, max_signatures=50000, max_seen_ids=200000, num_perm=64, bands=16, shingle_size=5, min_length=20, seed=1):
+
+        if num_perm % bands != 0:
+            raise ValueError('num_perm must be a multiple of bands')
+
+        self.threshold = threshold
+        self.window = datetime.timedelta(minutes=window_minutes)
+        self.max_signatures = max_signatures
+        self.max_seen_ids = max_seen_ids
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_length = min_length
+
+        random = np.random.RandomState(seed)
+        self.a = random.randint(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.b = random.randint(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+        self.signatures = {}
+        self.buckets = {}
+        # id_str -> (date, band keys) of the representatives, and id_str -> date of every checked tweet, oldest first
+        self.representatives = collections.OrderedDict()
+        self.seen_ids = collections.OrderedDict()
+
+    def signature(self, text):
+        '''
+        MinHash signature of the character shingles of an already normalized text
+        '''
+
+        shingles = {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) % _PRIME for shingle in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self.a * hashes + self.b) % _PRIME).min(axis=1)
+
+    def band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def seen(self, id_str):
+        '''
+        Whether the tweet was already checked inside the window, i.e. it is being redelivered (e.g. after a reconnection)
+        '''
+
+        return id_str in self.seen_ids
+
+    def check(self, id_str, text, date):
+        '''
+        Return the id_str of the representative this tweet is a near-duplicate of, or None if it is new
+        (in which case it becomes a representative itself). A redelivered tweet is never a duplicate of itself,
+        use seen() to tell redeliveries apart.
+        '''
+
+        self.expire(date)
+
+        if id_str in self.seen_ids:
+            return None
+        self.seen_ids[id_str] = date
+
+        text = normalize_text(text)
+        if len(text) < max(self.min_length, self.shingle_size):
+            return None
+
+        signature = self.signature(text)
+        keys = self.band_keys(signature)
+
+        # Candidates share at least one band, confirm them with the estimated Jaccard similarity
+        candidates = set().union(*(self.buckets[key] for key in keys if key in self.buckets))
+        for candidate in candidates:
+            if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                return candidate
+
+        self.signatures[id_str] = signature
+        for key in keys:
+            self.buckets.setdefault(key, set()).add(id_str)
+        self.representatives[id_str] = (date, keys)
+
+        return None
+
+    def forget(self, id_str):
+        '''
+        Undo the check of a tweet (e.g. because it could not be saved), so that it is treated as new if it comes again
+        '''
+
+        self.seen_ids.pop(id_str, None)
+        if id_str in self.representatives:
+            _, keys = self.representatives.pop(id_str)
+            self.remove(id_str, keys)
+
+    def remove(self, id_str, keys):
+        del self.signatures[id_str]
+        for key in keys:
+            self.buckets[key].discard(id_str)
+            if not self.buckets[key]:
+                del self.buckets[key]
+
+    def expire(self, date):
+        '''
+        Forget the representatives and ids that fell out of the time window or exceed their maximum number
+        '''
+
+        while self.representatives:
+            id_str, (oldest, keys) = next(iter(self.representatives.items()))
+            if oldest >= date - self.window and len(self.representatives) < self.max_signatures:
+                break
+            del self.representatives[id_str]
+            self.remove(id_str, keys)
+
+        while self.seen_ids:
+            id_str, oldest = next(iter(self.seen_ids.items()))
+            if oldest >= date - self.window and len(self.seen_ids) < self.max_seen_ids:
+                break
+            del self.seen_ids[id_str]
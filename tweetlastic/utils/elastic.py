@@ -127,13 +127,29 @@ def elastic_parse(tweet):
 
 def elastic_save(es, index_name, tweet):
 
-    # Save the tweet to ElasticSearch
+    # Save the tweet to ElasticSearch (using the tweet id, so that it can be updated later)
     es.index(
         index=index_name,
+        id=tweet['id_str'],
         body=tweet,
         ignore=400,
     )
 
+def elastic_increment(es, index_name, id_str, field, count):
+
+    # Add count to a numeric field of an already saved tweet
+    es.update(
+        index=index_name,
+        id=id_str,
+        body={
+            'script': {
+                'source': 'ctx._source[params.field] = (ctx._source[params.field] == null ? 0 : ctx._source[params.field]) + params.count',
+                'params': {'field': field, 'count': count},
+            }
+        },
+        ignore=[400, 404],
+    )
+
 
 class IndexOperations():
 
@@ -165,6 +181,10 @@ class IndexOperations():
                   "date": { 
                       "type": "date"
                   },
+
+                  "duplicates_count": {
+                      "type": "integer"
+                  },
                   
                   "hastags": {
                       "type": "text",
@@ -251,6 +271,11 @@ class IndexOperations():
                   "monetizable": {
                       "type": "boolean"
                   },
+
+                  "near_duplicate_of": {
+                      "type": "keyword",
+                      "ignore_above": 256
+                  },
               
                   "reply": {
                       "properties": {
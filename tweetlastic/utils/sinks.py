@@ -0,0 +1,294 @@
+# Standard
+import os
+import io
+import json
+import time
+import logging
+import datetime
+# Extra
+import zstandard
+
+# Custom
+from tweetlastic.utils.elastic import elastic_save, elastic_increment
+
+
+class ElasticSink():
+
+    '''
+    Save parsed tweets to an ElasticSearch index
+    '''
+
+    def __init__(self, es, index_name):
+
+        self.es = es
+        self.index_name = index_name
+
+    def save(self, tweet):
+        elastic_save(self.es, self.index_name, tweet=tweet)
+
+    def increment(self, id_str, field, count):
+        elastic_increment(self.es, self.index_name, id_str, field, count)
+
+    def tick(self):
+        return
+
+    def close(self):
+        return
+
+
+class ArchiveSink():
+
+    '''
+    Save parsed tweets into hourly zstd-compressed JSONL segments (one file per UTC hour of the tweet date).
+
+    Tweets are kept in memory until row_group_size of them are buffered or the oldest of them has waited
+    flush_seconds, and each row group is appended to its segment as an independent zstd frame.
+    '''
+
+    extension = '.jsonl.zst'
+
+    def __init__(self, path, row_group_size=1000, compression_level=3, flush_seconds=60):
+
+        self.path = path
+        self.row_group_size = row_group_size
+        self.flush_seconds = flush_seconds
+        self.compressor = zstandard.ZstdCompressor(level=compression_level)
+
+        self.buffer = []
+        self.buffer_started = None
+        self.segment_hour = None
+
+        os.makedirs(self.path, exist_ok=True)
+
+    def segment_path(self, hour):
+        return os.path.join(self.path, hour.strftime('%Y%m%d_%H') + self.extension)
+
+    def save(self, tweet):
+
+        # Segments are named after the UTC hour, the same way list_segments reads them
+        hour = _to_utc(tweet['date']).replace(minute=0, second=0, microsecond=0)
+
+        # Close the current row group if the tweet belongs to another segment
+        if self.segment_hour is not None and hour != self.segment_hour:
+            self.flush()
+
+        self.segment_hour = hour
+        if not self.buffer:
+            self.buffer_started = time.monotonic()
+        self.buffer.append(json.dumps(tweet, default=_serialize, ensure_ascii=False))
+
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+        else:
+            self.tick()
+
+    def tick(self):
+        '''
+        Flush the buffered rows if the oldest of them has waited more than flush_seconds
+        '''
+
+        if self.buffer and time.monotonic() - self.buffer_started >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        '''
+        Compress the buffered rows as a single frame and append it to the current segment
+        '''
+
+        if not self.buffer:
+            return
+
+        # Rows stay buffered until the frame is written, so that a failed write is retried on the next flush
+        row_group = ('\n'.join(self.buffer) + '\n').encode('utf-8')
+        with open(self.segment_path(self.segment_hour), 'ab') as file:
+            file.write(self.compressor.compress(row_group))
+
+        logging.debug('Archived ' + str(len(self.buffer)) + ' tweets to ' + self.segment_path(self.segment_hour))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+class FanOutSink():
+
+    '''
+    Send every parsed tweet to several sinks. An error in one sink does not prevent the tweet from
+    reaching the rest of them, but the first error is raised afterwards so that start_stream can
+    handle it (e.g. reconnecting when ElasticSearch is down).
+    '''
+
+    def __init__(self, sinks):
+
+        self.sinks = sinks
+
+    def save(self, tweet):
+        self._call_all('save', tweet)
+
+    def tick(self):
+        self._call_all('tick')
+
+    def close(self):
+        self._call_all('close')
+
+    def _call_all(self, method, *args):
+        error = None
+        for sink in self.sinks:
+            try:
+                getattr(sink, method)(*args)
+            except Exception as exc:
+                if error is None:
+                    error = exc
+                else:
+                    logging.exception('Error in ' + type(sink).__name__ + '.' + method)
+        if error is not None:
+            raise error
+
+
+class DedupSink():
+
+    '''
+    Suppress near-duplicate tweets (copy-paste spam, bot bursts) before they reach another sink. Depending on mode, near-duplicates are:
+        - drop: discarded.
+        - tag: saved with near_duplicate_of set to the id_str of the first tweet of the group.
+        - collapse: discarded, adding them instead to the duplicates_count of the first tweet of the group.
+          Counts are sent once flush_every duplicates are pending or the oldest of them has waited flush_seconds,
+          so the wrapped sink must implement increment().
+    '''
+
+    modes = ('drop', 'tag', 'collapse')
+
+    def __init__(self, sink, detector, mode='tag', flush_every=100, flush_seconds=60, report_every=1000):
+
+        if mode not in self.modes:
+            raise ValueError('Unknown near-duplicate mode: ' + str(mode))
+
+        self.sink = sink
+        self.detector = detector
+        self.mode = mode
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.report_every = report_every
+
+        self.pending_counts = {}
+        self.pending_started = None
+        self.seen = 0
+        self.duplicates = 0
+
+    def save(self, tweet):
+
+        # Redelivered tweets were already handled, saving them again would overwrite their duplicates_count
+        if self.detector.seen(tweet['id_str']):
+            return
+
+        self.seen += 1
+        representative = self.detector.check(tweet['id_str'], tweet['text'], tweet['date'])
+
+        if representative is None:
+            self._save(tweet)
+
+        else:
+            self.duplicates += 1
+            if self.mode == 'tag':
+                # Copy the tweet so that the rest of the sinks receive it untouched
+                self._save({**tweet, 'near_duplicate_of': representative})
+            elif self.mode == 'collapse':
+                if not self.pending_counts:
+                    self.pending_started = time.monotonic()
+                self.pending_counts[representative] = self.pending_counts.get(representative, 0) + 1
+                if sum(self.pending_counts.values()) >= self.flush_every:
+                    self.flush()
+                else:
+                    self.tick()
+
+        if self.seen % self.report_every == 0:
+            self.report()
+
+    def _save(self, tweet):
+        # If the tweet is not saved, forget it so that its copies don't point to a missing document
+        try:
+            self.sink.save(tweet)
+        except Exception:
+            self.detector.forget(tweet['id_str'])
+            raise
+
+    def flush(self):
+        # Remove each count only once it is applied, so that a failure halfway never sends it twice
+        while self.pending_counts:
+            id_str, count = next(iter(self.pending_counts.items()))
+            self.sink.increment(id_str, 'duplicates_count', count)
+            del self.pending_counts[id_str]
+
+    def report(self):
+        logging.info('Near-duplicates: ' + str(self.duplicates) + ' of ' + str(self.seen) + ' tweets (' + format(self.suppression_rate(), '.1%') + ', mode ' + self.mode + ')')
+
+    def suppression_rate(self):
+        return self.duplicates / self.seen if self.seen else 0.0
+
+    def tick(self):
+        if self.pending_counts and time.monotonic() - self.pending_started >= self.flush_seconds:
+            self.flush()
+        self.sink.tick()
+
+    def close(self):
+        self.flush()
+        self.report()
+        self.sink.close()
+
+
+def _serialize(value):
+    # Dates are stored in ISO format, the same way the ElasticSearch client sends them
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(type(value).__name__ + ' is not JSON serializable')
+
+
+def _to_utc(date):
+    # Segments are named after the UTC hour, naive dates are assumed to be in UTC already
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc)
+    return date.replace(tzinfo=None)
+
+
+def list_segments(path, start=None, end=None):
+    '''
+    List the archive segments in chronological order, optionally only those whose hour falls in [start, end]
+    '''
+
+    segments = []
+    for file_name in sorted(os.listdir(path)):
+        if not file_name.endswith(ArchiveSink.extension):
+            continue
+
+        hour = datetime.datetime.strptime(file_name[:-len(ArchiveSink.extension)], '%Y%m%d_%H')
+        if start is not None and hour < _to_utc(start).replace(minute=0, second=0, microsecond=0):
+            continue
+        if end is not None and hour > _to_utc(end):
+            continue
+
+        segments.append(os.path.join(path, file_name))
+
+    return segments
+
+
+def read_segment(segment_path):
+    '''
+    Stream the tweets of a segment back, decompressing it frame by frame instead of as a whole file.
+    Dates are returned as ISO strings.
+    '''
+
+    decompressor = zstandard.ZstdDecompressor()
+    with open(segment_path, 'rb') as file:
+        reader = decompressor.stream_reader(file, read_across_frames=True)
+        for line in io.TextIOWrapper(reader, encoding='utf-8'):
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_archive(path, start=None, end=None):
+    '''
+    Replay every archived tweet between the hours of start and end (both optional, naive dates are taken as UTC)
+    '''
+
+    for segment_path in list_segments(path, start, end):
+        yield from read_segment(segment_path)
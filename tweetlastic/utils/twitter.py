@@ -8,7 +8,7 @@ import time
 import tweepy
 
 # Custom
-from tweetlastic.utils.elastic import elastic_parse, elastic_save
+from tweetlastic.utils.elastic import elastic_parse
 
 class CustomStream(tweepy.StreamListener):
 
@@ -18,11 +18,10 @@ class CustomStream(tweepy.StreamListener):
     Should I initialize the Class before??
     '''
 
-    def __init__(self, es, index_name, logging_level, **kwargs):
+    def __init__(self, sink, logging_level, **kwargs):
 
         super().__init__(**kwargs)
-        self.es = es
-        self.index_name = index_name
+        self.sink = sink
 
         # Debug parameters
         if logging_level == "DEBUG":
@@ -73,15 +72,19 @@ class CustomStream(tweepy.StreamListener):
     
     #################################### Processing #########################
     
+    def keep_alive(self):
+        # Twitter sends keep-alives every few seconds, so buffered tweets get flushed even when the stream is quiet
+        self.sink.tick()
+
     def on_status(self, status):
         if not status.retweeted and not status.text.startswith('RT @') and not status.favorited: # Ignore RT and favorites, we just want original tweets
 
             # Parse tweet into .json object
             json_data = status._json
 
-            # Save object to our elasticsearch DB
+            # Save object to our sinks (elasticsearch DB, archive...)
             tweet=elastic_parse(json_data)
-            elastic_save(self.es, self.index_name, tweet=tweet)
+            self.sink.save(tweet)
 
             # Debug
             if self.debug:
@@ -108,8 +111,8 @@ def start_stream(stream,
         time.sleep(2)
         start_stream(stream, max_reconnects, hours_to_reset_counter, reconnects, **kwargs)
 
-    except:
-        # Catch the rest of exceptions.
+    except Exception:
+        # Catch the rest of exceptions (but not SystemExit, so that the app can be stopped).
         reconnects += 1
 
         # Check wether to reset number of reconnections based on elapsed time.